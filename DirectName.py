@@ -26,10 +26,12 @@
 
 import adsk.core, adsk.fusion, adsk.cam, traceback
 
+import abc
 import os
 import re
 import json
 import platform
+import time
 from datetime import datetime
 
 ADDIN_NAME = 'DirectName'
@@ -62,21 +64,158 @@ importlib.reload(thomasa88lib.commands)
 if IS_WINDOWS:
     importlib.reload(thomasa88lib.win.input)
 
-class RenameInfo:
-    def __init__(self, label: str):
+# An object to name. The current name is read once, when the object is
+# detected, so that the dialog, preview and execute don't have to ask Fusion.
+class RenameInfo(abc.ABC):
+    # Slots, as a batch can hold many objects
+    __slots__ = ('label', 'original_name', 'new_name', 'dirty')
+
+    def __init__(self, label: str, original_name: str):
         self.label = label
+        self.original_name = original_name
+        self.new_name = original_name
+        self.dirty = False
+
+    def set_name(self, name: str):
+        self.new_name = name
+        self.dirty = (name != self.original_name)
+
+    def apply(self):
+        if self.dirty:
+            self.write_name(self.new_name)
+
+    @property
+    def display_name(self):
+        # Identifies the object, for error messages
+        return f'{self.label} "{self.original_name}"'
+
+    @abc.abstractmethod
+    def write_name(self, name: str):
+        pass
 
 class ApiRenameInfo(RenameInfo):
+    __slots__ = ('name_obj', 'rename_field')
+
     def __init__(self, label: str, name_obj: adsk.core.Base,
                  rename_field='name'):
-        super().__init__(label)
+        super().__init__(label, getattr(name_obj, rename_field))
         self.name_obj = name_obj
         self.rename_field = rename_field
 
+    @property
+    def display_name(self):
+        if self.rename_field == 'name':
+            return super().display_name
+        # E.g. the part number is empty, so show which object it belongs to
+        return f'{self.label} of "{self.name_obj.name}"'
+
+    def write_name(self, name: str):
+        setattr(self.name_obj, self.rename_field, name)
+
 class TextCmdRenameInfo(RenameInfo):
+    __slots__ = ('entity_id', 'written')
+
     def __init__(self, label: str, entity_id: int):
-        super().__init__(label)
+        super().__init__(label, app_.executeTextCommand(f'PInterfaces.GetUserName {entity_id}'))
         self.entity_id = entity_id
+        self.written = False
+
+    def apply(self):
+        # We don't know if Fusion reverts text command renames done in a
+        # preview, so always write once a preview has changed the name. Else
+        # setting the original name back would leave the preview name.
+        if self.dirty or self.written:
+            self.write_name(self.new_name)
+            self.written = True
+
+    def write_name(self, name: str):
+        # The text command does not handle quotes - not even `\`-escaped.
+        name = name.replace('"', '')
+        app_.executeTextCommand(f'PInterfaces.Rename {self.entity_id} "{name}"')
+
+class ScanBudgetExceeded(Exception):
+    def __init__(self, kind: str, message: str):
+        super().__init__(message)
+        # 'time' or 'calls'
+        self.kind = kind
+
+# Bounds the time and the number of API calls that one scan may use.
+# Fusion is blocked while we scan, so a corrupted or enormous timeline must
+# not be allowed to freeze it.
+class ScanBudget:
+    def __init__(self, time_budget: float, call_budget: int):
+        self.start = time.perf_counter()
+        self.deadline = self.start + time_budget
+        self.time_budget = time_budget
+        self.call_budget = call_budget
+        self.calls = 0
+
+    def charge(self, calls=1):
+        self.calls += calls
+        if self.calls > self.call_budget:
+            raise ScanBudgetExceeded('calls', f"Call budget ({self.call_budget} calls) exceeded")
+        self.check_time()
+
+    def check_time(self):
+        if time.perf_counter() > self.deadline:
+            raise ScanBudgetExceeded('time', f"Time budget ({self.time_budget} s) exceeded "
+                                     f"after {self.calls} calls")
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+# Records command terminations and scans to a JSON lines file. The trace can be
+# replayed against a stand-in API using tools/replay_trace.py, to reproduce
+# problems without the user's design.
+class TraceRecorder:
+    def __init__(self):
+        self.file = None
+        self.path = None
+
+    @property
+    def active(self):
+        return self.file is not None
+
+    def start(self):
+        os.makedirs(TRACE_DIR, exist_ok=True)
+        self.path = os.path.join(TRACE_DIR, f'trace-{datetime.now():%Y%m%d-%H%M%S}.jsonl')
+        # Line buffered, to not lose records if Fusion crashes
+        self.file = open(self.path, 'w', encoding='utf-8', buffering=1)
+        self.write({ 'type': 'header', 'traceVersion': TRACE_FORMAT_VERSION,
+                     'addinVersion': manifest_['version'], 'os': OS })
+        log(f"Recording trace to {self.path}")
+
+    def stop(self):
+        if self.file:
+            self.file.close()
+            self.file = None
+            log(f"Trace recording stopped: {self.path}")
+
+    def write(self, record: dict):
+        record['t'] = round(time.time(), 3)
+        self.file.write(json.dumps(record, separators=(',', ':')) + '\n')
+
+    def write_terminated(self, command_id: str, reason: int):
+        self.write({ 'type': 'terminated', 'cmd': command_id, 'reason': reason })
+
+    def write_scan(self, flat_timeline, init: bool, command_id: str, tail_scan: bool,
+                   rename_objs: list[RenameInfo], calls: int, elapsed: float,
+                   flatten_elapsed: float, tripped: str):
+        # calls and elapsed must be taken before calling this, as summarizing
+        # the timeline makes many API calls.
+        self.write({ 'type': 'scan', 'cmd': command_id, 'init': init, 'tailScan': tail_scan,
+                     'length': len(flat_timeline),
+                     'tail': [summarize_timeline_obj(o) for o in flat_timeline[-TRACE_TAIL_LENGTH:]],
+                     'renames': [r.label for r in rename_objs],
+                     'calls': calls, 'elapsed': round(elapsed, 6),
+                     'flattenElapsed': round(flatten_elapsed, 6), 'tripped': tripped,
+                     'settings': { k: settings_[k] for k in TRACE_SETTINGS } })
+
+    def write_section_scan(self, command_id: str, rename_objs: list[RenameInfo],
+                           calls: int, elapsed: float, tripped: str):
+        self.write({ 'type': 'sectionScan', 'cmd': command_id,
+                     'renames': [r.label for r in rename_objs],
+                     'calls': calls, 'elapsed': round(elapsed, 6), 'tripped': tripped })
 
 SET_NAME_CMD_ID = 'thomasa88_setFeatureName'
 PANEL_ID = 'thomasa88_DirectNamePanel'
@@ -84,10 +223,25 @@ ENABLE_CMD_DEF_ID = 'thomasa88_DirectNameEnable'
 FILTER_CMD_DEF_ID_BASE = 'thomasa88_DirectNameFilter'
 BODY_INHERIT_NAME_ID = 'thomasa88_DirectNameBodyInherit'
 TROUBLESHOOT_ID = 'thomasa88_DirectNameTroubleshoot'
+SCAN_BREAKER_CMD_DEF_ID = 'thomasa88_DirectNameScanBreaker'
+TRACE_ID = 'thomasa88_DirectNameTrace'
+
+TRACE_DIR = os.path.join(FILE_DIR, 'traces')
+TRACE_FORMAT_VERSION = 1
+# Number of timeline objects, from the end, to describe in each scan record
+TRACE_TAIL_LENGTH = 20
 
 # Heuristic to find new bodies
 UNNAMED_BODY_PATTERN = re.compile(r'(?:Body|实体|Körper|ボディ|Corps|Corpo)\d+')
 
+# Number of timeline objects (or section analyses) to look at when a document
+# has tripped the scan breaker
+TAIL_SCAN_LENGTH = 10
+# Number of tail scans within budget before a full scan is tried again. Doubled
+# every time the breaker trips in a document, up to the max.
+TAIL_SCAN_RETRY_MIN = 10
+TAIL_SCAN_RETRY_MAX = 640
+
 RENAME_FILTER_OPTIONS = [
     ('nameComponents', 'Components (from Body)', True),
     ('nameCompDescrs', 'Component Descriptions', False),
@@ -104,9 +258,15 @@ ui_ = None
 error_catcher_ = thomasa88lib.error.ErrorCatcher(msgbox_in_debug=False, msg_prefix=ADDIN_NAME)
 events_manager_ = thomasa88lib.events.EventsManager(error_catcher_)
 manifest_ = thomasa88lib.manifest.read()
-default_settings = { 'enabled': True, 'bodyInheritName': False, 'troubleshoot': False }
+default_settings = { 'enabled': True, 'bodyInheritName': False, 'troubleshoot': False,
+                     # Per-scan limits. Can be tuned in the settings file.
+                     'scanTimeBudget': 2.0, 'scanCallBudget': 20000 }
 default_settings.update({ f[0]: f[2] for f in RENAME_FILTER_OPTIONS })
 settings_ = thomasa88lib.settings.SettingsManager(default_settings)
+# Settings that affect the scan result, recorded to be able to replay a trace
+TRACE_SETTINGS = [f[0] for f in RENAME_FILTER_OPTIONS] + ['scanTimeBudget', 'scanCallBudget']
+TRACE_OCCURRENCE_TYPES = { thomasa88lib.timeline.OCCURRENCE_NEW_COMP: 'newComp',
+                           thomasa88lib.timeline.OCCURRENCE_BODIES_COMP: 'bodiesComp' }
 
 need_init_ = True
 last_flat_timeline_ = None
@@ -122,6 +282,17 @@ enabled_: bool
 troubleshoot_: bool
 dialog_is_open_ = False
 scan_is_scheduled_ = False
+scan_breaker_cmd_def_ = None
+# Number of times the scan breaker tripped, per exceeded budget
+scan_breaker_trips_ = { 'time': 0, 'calls': 0 }
+# Documents that only get their timeline tail scanned, after tripping the breaker,
+# with the number of tail scans left until a full scan is tried again
+tail_scan_docs_: dict[str, int] = {}
+# Back-off level per document: the number of tail scans to do after the next trip
+tail_scan_retry_: dict[str, int] = {}
+trace_recorder_ = TraceRecorder()
+# Cost of the latest timeline scan, for troubleshooting and trace replay
+last_scan_stats_ = { 'calls': 0, 'elapsed': 0.0, 'tripped': None }
 
 def set_enabled(value):
     global enabled_
@@ -148,6 +319,57 @@ def load_troubleshoot():
     global troubleshoot_
     troubleshoot_ = settings_['troubleshoot']
 
+def new_scan_budget():
+    return ScanBudget(settings_['scanTimeBudget'], settings_['scanCallBudget'])
+
+def get_document_key():
+    doc = app_.activeDocument
+    return doc.creationId if doc else None
+
+def is_tail_scan():
+    return get_document_key() in tail_scan_docs_
+
+def trip_scan_breaker(e: ScanBudgetExceeded):
+    scan_breaker_trips_[e.kind] += 1
+    doc_key = get_document_key()
+    if doc_key is not None:
+        retry = tail_scan_retry_.get(doc_key, TAIL_SCAN_RETRY_MIN)
+        tail_scan_docs_[doc_key] = retry
+        tail_scan_retry_[doc_key] = min(retry * 2, TAIL_SCAN_RETRY_MAX)
+        # Always log this, as it affects what the add-in detects
+        log(f"Scan stopped: {e}. Only scanning the timeline tail in this document "
+            f"for the next {retry} scans.")
+    else:
+        log(f"Scan stopped: {e}.")
+    update_scan_breaker_button()
+
+def scan_within_budget(tail_scan: bool):
+    # Lets the document recover from the breaker after a while
+    doc_key = get_document_key()
+    if tail_scan:
+        remaining = tail_scan_docs_.get(doc_key, 0) - 1
+        if remaining > 0:
+            tail_scan_docs_[doc_key] = remaining
+        else:
+            tail_scan_docs_.pop(doc_key, None)
+            log("Trying a full scan again in this document")
+            update_scan_breaker_button()
+    elif doc_key in tail_scan_retry_:
+        # Full scans work again. Decay the back-off level.
+        retry = tail_scan_retry_[doc_key] // 2
+        if retry > TAIL_SCAN_RETRY_MIN:
+            tail_scan_retry_[doc_key] = retry
+        else:
+            del tail_scan_retry_[doc_key]
+
+def update_scan_breaker_button():
+    trips = scan_breaker_trips_
+    scan_breaker_cmd_def_.controlDefinition.name = (f'Scan breaker trips: {trips["time"]} time, '
+                                                    f'{trips["calls"]} calls')
+    scan_breaker_cmd_def_.tooltip = (f'Number of times a scan was stopped for exceeding its time or call budget.\n\n'
+                                     f'{len(tail_scan_docs_)} document(s) only get their timeline tail scanned.\n'
+                                     'Click to reset.')
+
 def workspace_activated_handler(args: adsk.core.WorkspaceEventArgs):
     global need_init_
 
@@ -184,6 +406,8 @@ def stop_monitoring():
 def command_terminated_handler(args: adsk.core.ApplicationCommandEventArgs):
     if get_troubleshoot():
         log(f"Terminated command: {args.commandId}, reason: {args.terminationReason}, object: {app_.activeEditObject.classType()}")
+    if trace_recorder_.active:
+        trace_recorder_.write_terminated(args.commandId, args.terminationReason)
 
     global need_init_
     if need_init_:
@@ -251,23 +475,40 @@ def after_terminate_handler(command_id: str):
         if command_id == 'FusionHalfSectionViewCommand':
             if get_troubleshoot():
                 log("Scanning for unnamed section view")
+            budget = new_scan_budget()
+            tripped = None
+            section_objs = []
             child_count = int(app_.executeTextCommand('Managed.Children VisualAnalyses'))
-            # Most likely the last child is the new one(?)
-            for i in range(child_count - 1, -1, -1):
-                # neu_server.get_user_name() always gives a name
-                # properties['userName'] is empty if the user has not set it
-                # properties['creationIndex'] is the default index. E.g. In Section3 index is 3.
-                entity_id: int = json.loads(app_.executeTextCommand(f'Managed.Child VisualAnalyses {i}'))['entityId']
-                section_properties = json.loads(app_.executeTextCommand(f'PEntity.Properties {entity_id}'))
-                if section_properties['userName'] == '':
-                    if settings_['nameSections']:
-                        rename_info = TextCmdRenameInfo("Section", entity_id)
-                        detected_rename_objs_.append(rename_info)
-                        if get_troubleshoot():
-                            labels = [o.label for o in detected_rename_objs_]
-                            log(f"Opening rename dialog for: {labels}")
-                        rename_cmd_def_.execute()
-                    break
+            tail_scan = is_tail_scan()
+            stop_index = max(child_count - TAIL_SCAN_LENGTH, 0) if tail_scan else 0
+            try:
+                # Most likely the last child is the new one(?)
+                for i in range(child_count - 1, stop_index - 1, -1):
+                    budget.charge(2)
+                    # neu_server.get_user_name() always gives a name
+                    # properties['userName'] is empty if the user has not set it
+                    # properties['creationIndex'] is the default index. E.g. In Section3 index is 3.
+                    entity_id: int = json.loads(app_.executeTextCommand(f'Managed.Child VisualAnalyses {i}'))['entityId']
+                    section_properties = json.loads(app_.executeTextCommand(f'PEntity.Properties {entity_id}'))
+                    if section_properties['userName'] == '':
+                        if settings_['nameSections']:
+                            # Reading the current name
+                            budget.charge()
+                            rename_info = TextCmdRenameInfo("Section", entity_id)
+                            section_objs.append(rename_info)
+                            detected_rename_objs_.append(rename_info)
+                            if get_troubleshoot():
+                                labels = [o.label for o in detected_rename_objs_]
+                                log(f"Opening rename dialog for: {labels}")
+                            rename_cmd_def_.execute()
+                        break
+                scan_within_budget(tail_scan)
+            except ScanBudgetExceeded as e:
+                trip_scan_breaker(e)
+                tripped = e.kind
+            if trace_recorder_.active:
+                trace_recorder_.write_section_scan(command_id, section_objs,
+                                                   budget.calls, budget.elapsed(), tripped)
         else:
             if dialog_is_open_:
                 if get_troubleshoot():
@@ -287,6 +528,7 @@ def after_terminate_handler(command_id: str):
 
 def check_timeline(init=False, trigger_cmd_id=None) -> list[RenameInfo]:
     global last_flat_timeline_
+    global last_scan_stats_
     rename_objs = []
 
     status, timeline = thomasa88lib.timeline.get_timeline()
@@ -295,112 +537,282 @@ def check_timeline(init=False, trigger_cmd_id=None) -> list[RenameInfo]:
 
     # User can expand/collapse the timeline groups without us knowing,
     # and it affects the timeline API structure, so get a flat timeline.
+    flatten_start = time.perf_counter()
     current_flat_timeline = thomasa88lib.timeline.flatten_timeline(timeline)
+    flatten_elapsed = time.perf_counter() - flatten_start
     
     if get_troubleshoot():
         log(f"Timeline: {[obj.name for obj in current_flat_timeline]}")
-
+        log(f"Timeline flattened in {flatten_elapsed:.3f} s")
+
+    # Flattening walks the whole timeline and cannot be bounded, not even by
+    # tail scanning, so it is not part of the budget. Tripping on it would only
+    # disable detection.
+    budget = new_scan_budget()
+    tail_scan = is_tail_scan()
+    tripped = None
     if not init:
-        # Doing Undo (Ctrl+Z) goes by unnoticed, so we can't rely on length
-        # to detect change.
-        # However, we know that the last addition should be just before the
-        # rollback bar.
-        # Update 2024-09-27: Undo and redo actually triggers Undo/Redo(DropDown)
-        # commands now. One command is sent even if one undos or redoes multiple
-        # commands at once using the dropdown. It will need som careful thinking
-        # to optimize based on incoming undo/redo. 
-        last_new_obj = None
-        index = 0
-        for next_index, next_obj in enumerate(current_flat_timeline):
-            if next_obj.isRolledBack:
-                break
-            index = next_index
-            last_new_obj = next_obj
-        
-        if get_troubleshoot():
-            log(f"Last new object: {last_new_obj.name if last_new_obj else 'None'} at index {index}")
-        
-        if last_new_obj:
-            # The user cannot name two timeline objects the same thing, but they
-            # can do create, undo, create and get a new object with the exact
-            # same name, making us miss it, if we go by name.
-            
-            # If an object is dragged in the timeline, we won't find it in the same place,
-            # but it is not a new object - so search the whole old timeline.
-
-            # Sketch + Solid/Feature is possible. New N components from N bodies
-            # are possible as well. Try to catch both.
-            # Search backwards until we recognize an object from earlier.
-            new_objs = []
-            for obj in reversed(current_flat_timeline[0:index+1]):
-                is_old = any(o == obj for o in last_flat_timeline_)
-                if is_old:
-                    break
-                new_objs.append(obj)
-            
-            if get_troubleshoot():
-                log(f"Candidate new objects: {[obj.name for obj in new_objs]}")
-
-            if new_objs:
-                # Creation order
-                new_objs.reverse()
-
-                for timeline_obj in new_objs:
-                    # Can't access entity of all timeline objects
-                    # Bug: https://forums.autodesk.com/t5/fusion-360-api-and-scripts/api-bug-cannot-access-entity-of-quot-move-quot-feature/m-p/9651921
-                    try:
-                        entity = timeline_obj.entity
-                    except RuntimeError:
-                        entity = None
-                    if entity:
-                        entity_type = thomasa88lib.utils.short_class(timeline_obj.entity)
-                        label = entity_type.replace('Feature', '')
-                        if entity_type == 'Occurrence':
-                            occur_type = thomasa88lib.timeline.get_occurrence_type(timeline_obj)
-                            # "New Component" lets the user name the component in its down dialog,
-                            # but New Component in Extrude does not have a naming dialog, so try
-                            # to catch that by checking what command triggered the timeline check.
-                            if (occur_type == thomasa88lib.timeline.OCCURRENCE_BODIES_COMP or
-                                (occur_type == thomasa88lib.timeline.OCCURRENCE_NEW_COMP and
-                                trigger_cmd_id != 'FusionCreateNewComponentCommand')):
-                                # Only the "Component from bodies" timeline feature can be renamed
-                                # In fact, it only makes sense to rename that timeline feature:
-                                # * New empty component already has a name field and it is
-                                #   forced onto the timeline object.
-                                # * Copy component means that the component already has a name.
-                                # Let the user name the timeline feature:
-                                if (occur_type == thomasa88lib.timeline.OCCURRENCE_BODIES_COMP
-                                    and settings_['nameFeatures']):
-                                    rename_objs.append(ApiRenameInfo("Create Comp", timeline_obj))
-                            
-                                if settings_['nameComponents']:
-                                    rename_objs.append(ApiRenameInfo("Component", entity.component))
-                            if  occur_type in (thomasa88lib.timeline.OCCURRENCE_NEW_COMP, thomasa88lib.timeline.OCCURRENCE_BODIES_COMP):
-                                if settings_['nameCompPartNums']:
-                                    rename_objs.append(ApiRenameInfo("Comp Part no", entity.component, rename_field='partNumber'))
-                                if settings_['nameCompDescrs']:
-                                    rename_objs.append(ApiRenameInfo("Comp Descr", entity.component, rename_field='description'))
-                        else:
-                            sketch = adsk.fusion.Sketch.cast(entity)
-                            if ((sketch and settings_['nameSketches']) or 
-                                (not sketch and settings_['nameFeatures'])):
-                                rename_objs.append(ApiRenameInfo(label, timeline_obj))
-                            if hasattr(entity, 'bodies') and settings_['nameBodies']:
-                                for body in entity.bodies:
-                                    # We cannot see if a body is newly created by this feature or already existed(?)
-                                    # Using a heuristic to catch all unnamed bodies. Possibly change to tracking the
-                                    # component tree (i.e. what is shown in the Browser).
-                                    if UNNAMED_BODY_PATTERN.match(body.name):
-                                        rename_objs.append(ApiRenameInfo(label + ' Body', body))
-                    else:
-                        if settings_['nameFeatures']:
-                            # re: Move1 -> Move
-                            label = re.sub(r'[0-9].*', '', timeline_obj.name)
-                            rename_objs.append(ApiRenameInfo(label, timeline_obj))
+        try:
+            find_rename_objs(current_flat_timeline, trigger_cmd_id, budget, rename_objs)
+            scan_within_budget(tail_scan)
+        except ScanBudgetExceeded as e:
+            trip_scan_breaker(e)
+            tripped = e.kind
+    # Before any logging or tracing, to not include their cost
+    scan_elapsed = budget.elapsed()
+    last_scan_stats_ = { 'calls': budget.calls, 'elapsed': scan_elapsed, 'tripped': tripped }
+    if not init and get_troubleshoot():
+        log(f"Scan used {budget.calls} calls in {scan_elapsed:.3f} s")
+
+    if trace_recorder_.active:
+        trace_recorder_.write_scan(current_flat_timeline, init, trigger_cmd_id, tail_scan,
+                                   rename_objs, budget.calls, scan_elapsed, flatten_elapsed,
+                                   tripped)
 
     last_flat_timeline_ = current_flat_timeline
     return rename_objs
 
+def find_rename_objs(current_flat_timeline, trigger_cmd_id, budget: ScanBudget,
+                     rename_objs: list[RenameInfo]):
+    # Appends to rename_objs, to keep what was found if the budget is exceeded.
+    stages = [stage for stage_settings, stage in RENAME_STAGES
+              if any(settings_[s] for s in stage_settings)]
+    if not stages:
+        # Nothing to name, so don't touch the timeline objects
+        return
+
+    # The pipeline is lazy, so every object is fully handled before the next
+    # one is fetched.
+    new_objs = diff_timeline(current_flat_timeline, budget)
+    resolved_objs = resolve_entities(new_objs, budget)
+    candidates = classify(resolved_objs, stages, trigger_cmd_id, budget)
+    for rename in emit(filter_enabled(candidates), budget):
+        rename_objs.append(rename)
+
+def diff_timeline(current_flat_timeline, budget: ScanBudget):
+    # Yields the new timeline objects, in creation order.
+
+    # Doing Undo (Ctrl+Z) goes by unnoticed, so we can't rely on length
+    # to detect change.
+    # However, we know that the last addition should be just before the
+    # rollback bar.
+    # Update 2024-09-27: Undo and redo actually triggers Undo/Redo(DropDown)
+    # commands now. One command is sent even if one undos or redoes multiple
+    # commands at once using the dropdown. It will need som careful thinking
+    # to optimize based on incoming undo/redo. 
+    tail_scan = is_tail_scan()
+    if tail_scan:
+        index = find_rollback_index(current_flat_timeline, budget)
+    else:
+        # Search from the end, as the rollback bar is most often there.
+        # All objects after the rollback bar are rolled back.
+        index = -1
+        for next_index in range(len(current_flat_timeline) - 1, -1, -1):
+            budget.charge()
+            if not current_flat_timeline[next_index].isRolledBack:
+                index = next_index
+                break
+    
+    if get_troubleshoot():
+        last_name = current_flat_timeline[index].name if index >= 0 else 'None'
+        log(f"Last new object: {last_name} at index {index}")
+    
+    if index < 0:
+        return
+
+    if tail_scan:
+        # The breaker has tripped for this document. Only look at the objects
+        # before the rollback bar, at the risk of missing new objects that
+        # were dragged far back.
+        stop_index = max(index + 1 - TAIL_SCAN_LENGTH, 0)
+        # The objects have the same position in the old timeline, unless
+        # objects before them were removed (larger index, covered by the
+        # length change) or added (smaller index, covered by the margin).
+        removed_count = max(len(last_flat_timeline_) - len(current_flat_timeline), 0)
+        old_timeline = last_flat_timeline_[max(stop_index - TAIL_SCAN_LENGTH, 0):
+                                           index + 1 + TAIL_SCAN_LENGTH + removed_count]
+    else:
+        stop_index = 0
+        old_timeline = last_flat_timeline_
+
+    # The user cannot name two timeline objects the same thing, but they
+    # can do create, undo, create and get a new object with the exact
+    # same name, making us miss it, if we go by name.
+    
+    # If an object is dragged in the timeline, we won't find it in the same place,
+    # but it is not a new object - so search the whole old timeline (unless
+    # tail scanning).
+
+    # Sketch + Solid/Feature is possible. New N components from N bodies
+    # are possible as well. Try to catch both.
+    # Search backwards until we recognize an object from earlier.
+    new_objs = []
+    for obj in reversed(current_flat_timeline[stop_index:index+1]):
+        if is_in_timeline(obj, old_timeline, budget):
+            break
+        new_objs.append(obj)
+    else:
+        if stop_index > 0:
+            # Tail scan without any known object. We cannot tell what is new,
+            # so better not ask the user to name existing objects.
+            if get_troubleshoot():
+                log("No known object in the timeline tail, skipping")
+            return
+    
+    if get_troubleshoot():
+        log(f"Candidate new objects: {[obj.name for obj in new_objs]}")
+
+    # Creation order
+    yield from reversed(new_objs)
+
+def find_rollback_index(flat_timeline, budget: ScanBudget):
+    # Returns the index of the last object before the rollback bar, or -1.
+    # Objects are rolled back from the bar to the end, so do a binary search,
+    # as the bar can be anywhere in a large timeline.
+    low = 0
+    high = len(flat_timeline)
+    while low < high:
+        budget.charge()
+        middle = (low + high) // 2
+        if flat_timeline[middle].isRolledBack:
+            high = middle
+        else:
+            low = middle + 1
+    return low - 1
+
+def resolve_entities(timeline_objs, budget: ScanBudget):
+    # Yields (timeline object, entity, entity type). Entity and type are None
+    # if the entity cannot be accessed.
+    for timeline_obj in timeline_objs:
+        budget.charge()
+        # Can't access entity of all timeline objects
+        # Bug: https://forums.autodesk.com/t5/fusion-360-api-and-scripts/api-bug-cannot-access-entity-of-quot-move-quot-feature/m-p/9651921
+        try:
+            entity = timeline_obj.entity
+        except RuntimeError:
+            entity = None
+        if entity:
+            yield timeline_obj, entity, thomasa88lib.utils.short_class(entity)
+        else:
+            yield timeline_obj, None, None
+
+def classify(resolved_objs, stages, trigger_cmd_id, budget: ScanBudget):
+    # Yields (setting, label, name object, rename field) from every stage, per object.
+    for resolved_obj in resolved_objs:
+        for stage in stages:
+            yield from stage(resolved_obj, trigger_cmd_id, budget)
+
+def filter_enabled(candidates):
+    for setting, *candidate in candidates:
+        if settings_[setting]:
+            yield candidate
+
+def emit(candidates, budget: ScanBudget):
+    # Reads the current names
+    for label, name_obj, rename_field in candidates:
+        budget.charge()
+        yield ApiRenameInfo(label, name_obj, rename_field)
+
+def feature_label(entity_type):
+    return entity_type.replace('Feature', '')
+
+# Stages get a resolved timeline object and yield
+# (setting, label, name object, rename field) for the objects that they handle.
+
+def occurrence_stage(resolved_obj, trigger_cmd_id, budget: ScanBudget):
+    timeline_obj, entity, entity_type = resolved_obj
+    if entity_type != 'Occurrence':
+        return
+    budget.charge()
+    occur_type = thomasa88lib.timeline.get_occurrence_type(timeline_obj)
+    if occur_type not in (thomasa88lib.timeline.OCCURRENCE_NEW_COMP, thomasa88lib.timeline.OCCURRENCE_BODIES_COMP):
+        return
+    budget.charge()
+    component = entity.component
+    # "New Component" lets the user name the component in its down dialog,
+    # but New Component in Extrude does not have a naming dialog, so try
+    # to catch that by checking what command triggered the timeline check.
+    if (occur_type == thomasa88lib.timeline.OCCURRENCE_BODIES_COMP or
+        trigger_cmd_id != 'FusionCreateNewComponentCommand'):
+        # Only the "Component from bodies" timeline feature can be renamed
+        # In fact, it only makes sense to rename that timeline feature:
+        # * New empty component already has a name field and it is
+        #   forced onto the timeline object.
+        # * Copy component means that the component already has a name.
+        # Let the user name the timeline feature:
+        if occur_type == thomasa88lib.timeline.OCCURRENCE_BODIES_COMP:
+            yield 'nameFeatures', "Create Comp", timeline_obj, 'name'
+        yield 'nameComponents', "Component", component, 'name'
+    yield 'nameCompPartNums', "Comp Part no", component, 'partNumber'
+    yield 'nameCompDescrs', "Comp Descr", component, 'description'
+
+def sketch_stage(resolved_obj, trigger_cmd_id, budget: ScanBudget):
+    # No API calls, the budget is only taken to match the other stages
+    timeline_obj, entity, entity_type = resolved_obj
+    if entity_type == 'Sketch':
+        yield 'nameSketches', feature_label(entity_type), timeline_obj, 'name'
+
+def feature_stage(resolved_obj, trigger_cmd_id, budget: ScanBudget):
+    timeline_obj, entity, entity_type = resolved_obj
+    if entity is None:
+        budget.charge()
+        # re: Move1 -> Move
+        label = re.sub(r'[0-9].*', '', timeline_obj.name)
+        yield 'nameFeatures', label, timeline_obj, 'name'
+    elif entity_type not in ('Occurrence', 'Sketch'):
+        yield 'nameFeatures', feature_label(entity_type), timeline_obj, 'name'
+
+def body_stage(resolved_obj, trigger_cmd_id, budget: ScanBudget):
+    timeline_obj, entity, entity_type = resolved_obj
+    if entity is None or entity_type == 'Occurrence':
+        return
+    budget.charge()
+    if not hasattr(entity, 'bodies'):
+        return
+    label = feature_label(entity_type) + ' Body'
+    for body in entity.bodies:
+        budget.charge()
+        # We cannot see if a body is newly created by this feature or already existed(?)
+        # Using a heuristic to catch all unnamed bodies. Possibly change to tracking the
+        # component tree (i.e. what is shown in the Browser).
+        if UNNAMED_BODY_PATTERN.match(body.name):
+            yield 'nameBodies', label, body, 'name'
+
+# (Settings that the stage yields for, stage). A stage is skipped when all its
+# settings are disabled. Stages run in this order for each new object.
+RENAME_STAGES = [
+    (('nameFeatures', 'nameComponents', 'nameCompPartNums', 'nameCompDescrs'), occurrence_stage),
+    (('nameSketches',), sketch_stage),
+    (('nameFeatures',), feature_stage),
+    (('nameBodies',), body_stage),
+]
+
+def summarize_timeline_obj(timeline_obj):
+    # Describes what the scan looks at, so that a stand-in object can be
+    # created when replaying.
+    summary = { 'name': timeline_obj.name, 'rolledBack': timeline_obj.isRolledBack,
+                'entity': None }
+    try:
+        entity = timeline_obj.entity
+    except RuntimeError:
+        entity = None
+    if entity:
+        summary['entity'] = entity.classType()
+        if thomasa88lib.utils.short_class(entity) == 'Occurrence':
+            summary['occurrence'] = TRACE_OCCURRENCE_TYPES.get(
+                thomasa88lib.timeline.get_occurrence_type(timeline_obj), 'other')
+        elif hasattr(entity, 'bodies'):
+            summary['bodies'] = [body.name for body in entity.bodies]
+    return summary
+
+def is_in_timeline(obj, flat_timeline, budget: ScanBudget):
+    # Every comparison is an API call
+    for o in flat_timeline:
+        budget.charge()
+        if o == obj:
+            return True
+    return False
+
 def rename_command_created_handler(args: adsk.core.CommandCreatedEventArgs):
     # The nifty thing with cast is that code completion then knows the object type
     cmd = adsk.core.Command.cast(args.command)
@@ -443,13 +855,7 @@ def rename_command_created_handler(args: adsk.core.CommandCreatedEventArgs):
     for i, rename in enumerate(dialog_rename_objs_):
         label_input = table.commandInputs.addStringValueInput(f'label_{i}', '', rename.label)
         label_input.isReadOnly = True
-        if isinstance(rename, ApiRenameInfo):
-            obj_name = getattr(rename.name_obj, rename.rename_field)
-        elif isinstance(rename, TextCmdRenameInfo):
-            obj_name = app_.executeTextCommand(f'PInterfaces.GetUserName {rename.entity_id}')
-        else:
-            log(f"Dialog: Unknown rename type: {type(rename)}")
-            raise Exception(f"Unknown rename type: {type(rename)}")
+        obj_name = rename.original_name
         if get_troubleshoot():
             log(f"Dialog: Add '{obj_name}'")
 
@@ -505,8 +911,8 @@ def rename_command_execute_handler(args: adsk.core.CommandEventArgs):
         # At least on operation failed
         args.executeFailed = True
         args.executeFailedMessage = f"{ADDIN_NAME} failed. Failed to rename features:<ul>"
-        for old_name, new_name in failures:
-            args.executeFailedMessage += f'<li>"{old_name}" -> "{new_name}"'
+        for display_name, new_name in failures:
+            args.executeFailedMessage += f'<li>{display_name} -> "{new_name}"'
         args.executeFailedMessage += "</ul>"
 
 def rename_command_execute_preview_handler(args: adsk.core.CommandEventArgs):
@@ -556,24 +962,18 @@ def try_rename_objects(inputs):
     failures = []
 
     for i, rename in enumerate(dialog_rename_objs_):
-        input = inputs.itemById(f'string_{i}')
-        if isinstance(rename, ApiRenameInfo):
-            try:
-                if getattr(rename.name_obj, rename.rename_field) != input.value:
-                    setattr(rename.name_obj, rename.rename_field, input.value)
-            except RuntimeError as e:
-                failures.append((rename.name_obj.name, input.value))
-                error_info = str(e)
-                error_split = error_info.split(' : ', maxsplit=1)
-                if len(error_split) == 2:
-                    error_info = error_split[1]
-        elif isinstance(rename, TextCmdRenameInfo):
-            if app_.executeTextCommand(f'PInterfaces.GetUserName {rename.entity_id}') != input.value:
-                # The text command does not handle quotes - not even `\`-escaped.
-                new_name = input.value.replace('"', '')
-                app_.executeTextCommand(f'PInterfaces.Rename {rename.entity_id} "{new_name}"')
-        else:
-            raise Exception(f"Unknown rename type: {type(rename)}")
+        # Fusion undoes API changes made in the preview before running the
+        # next preview or the execute, so API objects still have their original
+        # name here. TextCmdRenameInfo handles renames that might not be undone.
+        rename.set_name(inputs.itemById(f'string_{i}').value)
+        try:
+            rename.apply()
+        except RuntimeError as e:
+            failures.append((rename.display_name, rename.new_name))
+            error_info = str(e)
+            error_split = error_info.split(' : ', maxsplit=1)
+            if len(error_split) == 2:
+                error_info = error_split[1]
     
     return failures
 
@@ -603,6 +1003,24 @@ def troubleshoot_command_created_handler(args: adsk.core.CommandCreatedEventArgs
     ctl_def: adsk.core.CheckBoxControlDefinition = cmd_def.controlDefinition
     set_troubleshoot(ctl_def.isChecked)
 
+def trace_command_created_handler(args: adsk.core.CommandCreatedEventArgs):
+    cmd_def = args.command.parentCommandDefinition
+    ctl_def: adsk.core.CheckBoxControlDefinition = cmd_def.controlDefinition
+    if ctl_def.isChecked:
+        trace_recorder_.start()
+        # Give the replay a starting point
+        check_timeline(init=True)
+    else:
+        trace_recorder_.stop()
+
+def scan_breaker_command_created_handler(args: adsk.core.CommandCreatedEventArgs):
+    for kind in scan_breaker_trips_:
+        scan_breaker_trips_[kind] = 0
+    tail_scan_docs_.clear()
+    tail_scan_retry_.clear()
+    update_scan_breaker_button()
+    log("Scan breaker reset")
+
 def update_enable_button():
     if get_enabled():
         state_text = 'enabled'
@@ -623,6 +1041,7 @@ def run(context):
     global ui_
     global rename_cmd_def_
     global enable_cmd_def_
+    global scan_breaker_cmd_def_
     global panel_
     with error_catcher_:
         app_ = adsk.core.Application.get()
@@ -698,6 +1117,26 @@ def run(context):
         panel_.controls.addCommand(troubleshoot_def)
         events_manager_.add_handler(troubleshoot_def.commandCreated, callback=troubleshoot_command_created_handler)
 
+        # Not stored in settings, to not fill the disk by mistake
+        trace_def = thomasa88lib.commands.recreate_checkbox_def(
+            TRACE_ID, 'Record event trace',
+            "Records commands and timeline scans to a trace file in the add-in's traces folder, "
+            "for reproducing performance problems. Recording stops when Fusion is closed.",
+            False
+        )
+        panel_.controls.addCommand(trace_def)
+        events_manager_.add_handler(trace_def.commandCreated, callback=trace_command_created_handler)
+
+        scan_breaker_cmd_def_ = ui_.commandDefinitions.itemById(SCAN_BREAKER_CMD_DEF_ID)
+        if scan_breaker_cmd_def_:
+            scan_breaker_cmd_def_.deleteMe()
+        scan_breaker_cmd_def_ = ui_.commandDefinitions.addButtonDefinition(SCAN_BREAKER_CMD_DEF_ID,
+                                                                          'Loading...', '')
+        update_scan_breaker_button()
+        panel_.controls.addCommand(scan_breaker_cmd_def_)
+        events_manager_.add_handler(scan_breaker_cmd_def_.commandCreated,
+                                    callback=scan_breaker_command_created_handler)
+
         events_manager_.add_handler(rename_cmd_def_.commandCreated,
                                     callback=rename_command_created_handler)
         
@@ -714,6 +1153,7 @@ def run(context):
 def stop(context):
     with error_catcher_:
         events_manager_.clean_up()
+        trace_recorder_.stop()
 
         cmd_def = ui_.commandDefinitions.itemById(SET_NAME_CMD_ID)
         if cmd_def:
@@ -0,0 +1,305 @@
+# This file is part of DirectName, a Fusion 360 add-in for naming
+# features directly after creation.
+#
+# Copyright (c) 2020 Thomas Axelsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Stand-in for the parts of the Fusion API (adsk) and thomasa88lib that the
+DirectName scan uses, so that the add-in can be loaded outside of Fusion.
+
+Only meant for replaying traces. Anything that is not modelled here either
+does nothing or raises.'''
+
+import importlib.abc
+import importlib.util
+import os
+import sys
+
+ADDIN_PACKAGE = 'DirectName'
+
+class Base:
+    @classmethod
+    def cast(cls, obj):
+        return obj if isinstance(obj, cls) else None
+
+    def classType(self):
+        return f'adsk::{self._namespace}::{type(self).__name__}'
+
+    _namespace = 'core'
+
+class Unmodelled(Base):
+    '''Placeholder for API classes only used in annotations.'''
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def __getattr__(self, name):
+        return Unmodelled()
+
+    def __setattr__(self, name, value):
+        pass
+
+    def __call__(self, *args, **kwargs):
+        return Unmodelled()
+
+class Application(Base):
+    _instance = None
+
+    def __init__(self):
+        self.activeProduct = Design()
+        self.activeDocument = Document()
+        self.userInterface = UserInterface()
+        self.isStartupComplete = True
+        self.log_func = None
+
+    @classmethod
+    def get(cls):
+        if not cls._instance:
+            cls._instance = Application()
+        return cls._instance
+
+    @property
+    def activeEditObject(self):
+        return self.activeProduct.activeEditObject
+
+    def log(self, message, *args, **kwargs):
+        if self.log_func:
+            self.log_func(message)
+
+    def executeTextCommand(self, command):
+        raise NotImplementedError(f"Text commands are not modelled: {command}")
+
+class Document(Base):
+    creationId = 'replay'
+
+class UserInterface(Base):
+    activeCommand = None
+
+class CommandTerminationReason:
+    UnknownTerminationReason = 0
+    CompletedTerminationReason = 1
+    CancelledTerminationReason = 2
+    AbortedTerminationReason = 3
+    PreEmptedTerminationReason = 4
+    SessionEndingTerminationReason = 5
+
+class Design(Base):
+    _namespace = 'fusion'
+
+    def __init__(self):
+        self.rootComponent = Component('(Root)')
+        self.activeEditObject = self.rootComponent
+
+class Component(Base):
+    _namespace = 'fusion'
+
+    def __init__(self, name, partNumber='', description=''):
+        self.name = name
+        self.partNumber = partNumber
+        self.description = description
+
+class BRepBody(Base):
+    _namespace = 'fusion'
+
+    def __init__(self, name, parentComponent=None):
+        self.name = name
+        self.parentComponent = parentComponent
+
+class Sketch(Base):
+    _namespace = 'fusion'
+
+class Entity(Base):
+    '''Any timeline entity. Reports the class type it was recorded with.'''
+    def __init__(self, class_type, bodies=None, occurrence_type=None):
+        self.class_type = class_type
+        if bodies is not None:
+            self.bodies = [BRepBody(name) for name in bodies]
+        if occurrence_type is not None:
+            self.component = Component(f'Component of {class_type}')
+        self.occurrence_type = occurrence_type
+
+    def classType(self):
+        return self.class_type
+
+class SketchEntity(Entity, Sketch):
+    pass
+
+class TimelineObject(Base):
+    '''Compares by identity, like the real objects compare by the entity they wrap.'''
+    def __init__(self, name, isRolledBack=False, entity=None):
+        self.name = name
+        self.isRolledBack = isRolledBack
+        self._entity = entity
+
+    @property
+    def entity(self):
+        if self._entity is None:
+            # Mimic timeline objects that cannot give their entity
+            raise RuntimeError('3 : Entity is not available')
+        return self._entity
+
+def make_entity(class_type, bodies=None, occurrence_type=None):
+    cls = SketchEntity if class_type == 'adsk::fusion::Sketch' else Entity
+    return cls(class_type, bodies, occurrence_type)
+
+def _unmodelled_getattr(name):
+    if name.startswith('__'):
+        raise AttributeError(name)
+    return type(name, (Unmodelled,), {})
+
+def _populate_adsk(module):
+    pass
+
+def _populate_adsk_core(module):
+    module.Base = Base
+    module.Application = Application
+    module.CommandTerminationReason = CommandTerminationReason
+    module.__getattr__ = _unmodelled_getattr
+
+def _populate_adsk_fusion(module):
+    module.Design = Design
+    module.Component = Component
+    module.BRepBody = BRepBody
+    module.Sketch = Sketch
+    module.__getattr__ = _unmodelled_getattr
+
+def _populate_lib(module):
+    pass
+
+def _populate_lib_utils(module):
+    def short_class(obj):
+        return obj.classType().split('::')[-1]
+    module.short_class = short_class
+
+# The scan timeline, set by the replay driver
+current_timeline = []
+
+def _populate_lib_timeline(module):
+    module.TIMELINE_STATUS_OK = 0
+    module.TIMELINE_STATUS_PRETTY = 1
+    module.TIMELINE_STATUS_NOT_PARAMETRIC = 2
+    # Same names as recorded in traces
+    module.OCCURRENCE_NEW_COMP = 'newComp'
+    module.OCCURRENCE_BODIES_COMP = 'bodiesComp'
+
+    def get_timeline():
+        return module.TIMELINE_STATUS_OK, current_timeline
+
+    def flatten_timeline(timeline):
+        return list(timeline)
+
+    def get_occurrence_type(timeline_obj):
+        return timeline_obj.entity.occurrence_type
+
+    module.get_timeline = get_timeline
+    module.flatten_timeline = flatten_timeline
+    module.get_occurrence_type = get_occurrence_type
+
+def _populate_lib_manifest(module):
+    module.read = lambda: { 'version': 'replay' }
+
+def _populate_lib_error(module):
+    class ErrorCatcher:
+        def __init__(self, *args, **kwargs):
+            pass
+
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            # Let errors through, to fail the replay
+            return False
+    module.ErrorCatcher = ErrorCatcher
+
+def _populate_lib_events(module):
+    class EventsManager:
+        def __init__(self, error_catcher=None):
+            self.delayed = []
+
+        def add_handler(self, event, callback):
+            return (event, callback)
+
+        def remove_handler(self, handler_info):
+            return None
+
+        def delay(self, func, secs=0):
+            self.delayed.append(func)
+
+        def clean_up(self):
+            pass
+    module.EventsManager = EventsManager
+
+def _populate_lib_settings(module):
+    class SettingsManager(dict):
+        def __init__(self, default_values):
+            super().__init__(default_values)
+    module.SettingsManager = SettingsManager
+
+def _populate_lib_commands(module):
+    module.recreate_checkbox_def = lambda *args, **kwargs: Unmodelled()
+
+_LIB = f'{ADDIN_PACKAGE}.thomasa88lib'
+_MODULES = {
+    'adsk': (_populate_adsk, True),
+    'adsk.core': (_populate_adsk_core, False),
+    'adsk.fusion': (_populate_adsk_fusion, False),
+    'adsk.cam': (_populate_adsk, False),
+    _LIB: (_populate_lib, True),
+    f'{_LIB}.utils': (_populate_lib_utils, False),
+    f'{_LIB}.timeline': (_populate_lib_timeline, False),
+    f'{_LIB}.manifest': (_populate_lib_manifest, False),
+    f'{_LIB}.error': (_populate_lib_error, False),
+    f'{_LIB}.events': (_populate_lib_events, False),
+    f'{_LIB}.settings': (_populate_lib_settings, False),
+    f'{_LIB}.commands': (_populate_lib_commands, False),
+}
+
+class _StandInFinder(importlib.abc.MetaPathFinder, importlib.abc.Loader):
+    # Being a real finder (and not only entries in sys.modules) makes
+    # importlib.reload() in the add-in work.
+    def find_spec(self, fullname, path, target=None):
+        if fullname not in _MODULES:
+            return None
+        _, is_package = _MODULES[fullname]
+        return importlib.util.spec_from_loader(fullname, self, is_package=is_package)
+
+    def create_module(self, spec):
+        return None
+
+    def exec_module(self, module):
+        populate, is_package = _MODULES[module.__name__]
+        if is_package:
+            module.__path__ = []
+        populate(module)
+
+def install():
+    if not any(isinstance(f, _StandInFinder) for f in sys.meta_path):
+        sys.meta_path.insert(0, _StandInFinder())
+
+def load_addin(addin_file):
+    '''Loads the add-in the way Fusion does: as a package, so that its
+    relative imports work.'''
+    install()
+    spec = importlib.util.spec_from_file_location(
+        ADDIN_PACKAGE, addin_file,
+        submodule_search_locations=[os.path.dirname(addin_file)])
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[ADDIN_PACKAGE] = module
+    spec.loader.exec_module(module)
+    return module
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+
+# This file is part of DirectName, a Fusion 360 add-in for naming
+# features directly after creation.
+#
+# Copyright (c) 2020 Thomas Axelsson
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+'''Replays a DirectName trace (recorded with "Record event trace") against a
+stand-in Fusion API and checks that the timeline scan finds the same objects
+to rename as when the trace was recorded.
+
+Usage: replay_trace.py [-v] TRACE_FILE...
+
+Exits with status 1 if any scan gives a different result, or uses more API
+calls than when recorded. Call counts are compared instead of scan times, as
+the stand-in API is much faster than Fusion.
+
+Scans that were stopped by the time budget when recorded only have part of
+their result. For them, the replayed result must start with the recorded
+result (a superset), and call counts are not compared.
+
+Only the end of the timeline is recorded, so timeline objects are identified
+by name when replaying. Section analysis scans use text commands and are only
+reported, not replayed.'''
+
+import argparse
+import json
+import os
+import sys
+
+import adsk_standin
+
+ADDIN_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+                          'DirectName.py')
+
+class TimelineRebuilder:
+    '''Recreates a full timeline from recorded tails, keeping object identity
+    between scans.'''
+    def __init__(self):
+        # Object at each timeline position, from earlier records
+        self.positions = []
+        self.by_name = {}
+
+    def rebuild(self, length, tail):
+        prefix_length = length - len(tail)
+        timeline = []
+        for i in range(prefix_length):
+            if i < len(self.positions):
+                obj = self.positions[i]
+            else:
+                obj = adsk_standin.TimelineObject(f'(unrecorded {i})')
+            timeline.append(obj)
+        for summary in tail:
+            timeline.append(self.get_obj(summary))
+        self.positions = timeline
+        return timeline
+
+    def get_obj(self, summary):
+        obj = self.by_name.get(summary['name'])
+        if not obj:
+            obj = adsk_standin.TimelineObject(summary['name'])
+            self.by_name[summary['name']] = obj
+        obj.isRolledBack = summary['rolledBack']
+        if summary['entity']:
+            obj._entity = adsk_standin.make_entity(summary['entity'],
+                                                   bodies=summary.get('bodies'),
+                                                   occurrence_type=summary.get('occurrence'))
+        else:
+            obj._entity = None
+        return obj
+
+def replay(addin, path, verbose):
+    rebuilder = TimelineRebuilder()
+    mismatches = 0
+    regressions = 0
+    scans = 0
+    recorded_calls = 0
+    replay_calls = 0
+    doc_key = addin.get_document_key()
+
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, start=1):
+            record = json.loads(line)
+            record_type = record['type']
+            if record_type == 'header':
+                print(f"{path}: DirectName {record['addinVersion']} on {record['os']}")
+                if record['traceVersion'] != addin.TRACE_FORMAT_VERSION:
+                    print(f"  Trace format {record['traceVersion']} is not supported")
+                    return 1
+            elif record_type == 'terminated':
+                if verbose:
+                    print(f"  {line_no}: terminated {record['cmd']} ({record['reason']})")
+            elif record_type == 'sectionScan':
+                print(f"  {line_no}: section scan {record['cmd']} not replayed "
+                      f"({record['elapsed'] * 1000:.1f} ms recorded)")
+            elif record_type == 'scan':
+                addin.settings_.update(record['settings'])
+                # Follow the recorded breaker state, as timings differ
+                if record['tailScan']:
+                    addin.tail_scan_docs_[doc_key] = 1
+                else:
+                    addin.tail_scan_docs_.pop(doc_key, None)
+                adsk_standin.current_timeline = rebuilder.rebuild(record['length'], record['tail'])
+
+                if not record['init'] and addin.last_flat_timeline_ is None:
+                    print(f"  {line_no}: scan {record['cmd']} skipped: No earlier init scan")
+                    continue
+
+                if record['init']:
+                    rename_objs = addin.check_timeline(init=True)
+                else:
+                    rename_objs = addin.check_timeline(trigger_cmd_id=record['cmd'])
+                calls = addin.last_scan_stats_['calls']
+
+                labels = [r.label for r in rename_objs]
+                scans += 1
+                time_tripped = record['tripped'] == 'time'
+                if time_tripped:
+                    # Partial result when recorded
+                    ok = labels[:len(record['renames'])] == record['renames']
+                    calls_ok = True
+                else:
+                    ok = labels == record['renames']
+                    calls_ok = calls <= record['calls']
+                    recorded_calls += record['calls']
+                    replay_calls += calls
+                if not ok:
+                    mismatches += 1
+                if not calls_ok:
+                    regressions += 1
+                if verbose or not ok or not calls_ok:
+                    kind = 'init scan' if record['init'] else f"scan {record['cmd']}"
+                    if not ok:
+                        result = 'MISMATCH'
+                    elif not calls_ok:
+                        result = 'MORE CALLS'
+                    else:
+                        result = 'OK'
+                    note = ' (time budget exceeded when recorded)' if time_tripped else ''
+                    print(f"  {line_no}: {kind}: {result} "
+                          f"{record['calls']} calls recorded, {calls} calls replayed{note}")
+                    if not ok:
+                        print(f"    recorded: {record['renames']}")
+                        print(f"    replayed: {labels}")
+            else:
+                print(f"  {line_no}: Unknown record type: {record_type}")
+
+    print(f"  {scans} scans, {mismatches} mismatches, {regressions} call regressions. "
+          f"API calls: {recorded_calls} recorded, {replay_calls} replayed")
+    return 1 if mismatches or regressions else 0
+
+def main():
+    parser = argparse.ArgumentParser(description='Replay DirectName traces.')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='show every record and the add-in log')
+    parser.add_argument('traces', nargs='+', metavar='TRACE_FILE')
+    args = parser.parse_args()
+
+    addin = adsk_standin.load_addin(ADDIN_FILE)
+    addin.app_ = adsk_standin.Application.get()
+    addin.ui_ = addin.app_.userInterface
+    addin.scan_breaker_cmd_def_ = adsk_standin.Unmodelled()
+    addin.load_enabled()
+    addin.load_troubleshoot()
+    if args.verbose:
+        addin.app_.log_func = lambda message: print(f'    log: {message}')
+
+    status = 0
+    for path in args.traces:
+        # Each trace starts from scratch
+        addin.last_flat_timeline_ = None
+        addin.tail_scan_docs_.clear()
+        addin.tail_scan_retry_.clear()
+        status |= replay(addin, path, args.verbose)
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())